@@ -16,7 +16,7 @@ exec >> "${LOGFILE}" 2>&1
 
 find "${logdir}" -type f -not -path "${LOGFILE}" -not -name \*.gz -exec gzip -9 {} \;
 
-rsync -aqzP --delete --delete-after "${RSYNC_ADDRESS:?}::www" /home/ubuntu/appstream
+rsync -aHqzP --delete --delete-after "${RSYNC_ADDRESS:?}::www" /home/ubuntu/appstream
 rsync -aqzP --delete --delete-after "${RSYNC_ADDRESS:?}::logs" /home/ubuntu/logs
 
 # finish logging
@@ -189,6 +189,13 @@ class AppstreamFrontendCharm(CharmBase):
                 Options -Indexes
             </Directory>
 
+            <Directory /home/ubuntu/appstream/search>
+                Options -Indexes
+                <IfModule mod_headers.c>
+                    Header set Cache-Control "public, max-age=300"
+                </IfModule>
+            </Directory>
+
             <Directory /home/ubuntu/logs>
                 Options Indexes
                 Require all granted
@@ -198,6 +205,7 @@ class AppstreamFrontendCharm(CharmBase):
             Alias /media /home/ubuntu/appstream/media
             Alias /logs /home/ubuntu/logs
             Alias /hints /home/ubuntu/appstream/hints
+            Alias /search /home/ubuntu/appstream/search
             <VirtualHost *:80>
                 ServerName {external_hostname}
                 DocumentRoot /home/ubuntu/appstream/html
@@ -212,7 +220,7 @@ class AppstreamFrontendCharm(CharmBase):
         data["enabled"] = "true"
         data["ports"] = "80"
         data["site_config"] = apache_config
-        data["site-modules"] = "autoindex"
+        data["site-modules"] = "autoindex headers"
         logger.info(f"Setting up apache site for {external_hostname}")
         self._stored.apache_related = True
         self._maybe_set_active()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# Copyright 2021 Canonical Ltd
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Build a static, sharded search index from the published
+# data/<suite>/<component>/Components-<arch>.yml.gz files, so that clients can
+# look up a component with one small fetch instead of downloading and parsing
+# the whole YAML. The layout under OUTPUT is:
+#
+#   index.json                   suites which have an index
+#   <suite>/meta.json            what the suite's index was built from
+#   <suite>/id/<hh>.json         component ID → [entry, ...]
+#   <suite>/package/<hh>.json    package name → [entry, ...]
+#   <suite>/prefix/<pp>.json     [[key, component ID], ...], sorted by key
+#
+# <hh> is the first two hex digits of the SHA-1 of the ID or package name.
+# <pp> is the first two characters of the lowercased key, with anything
+# outside [a-z0-9] replaced by "_"; keys are package names and the last part
+# of each component ID (e.g. "firefox" for org.mozilla.firefox.desktop).
+# Full component IDs are not prefix keys, since nearly all of them start with
+# "or", "co" or "io"; exact ID lookups use id/ instead.
+#
+# Suites whose Components files have the same content as at the last run are
+# skipped. asgen rewrites these files on every run, so their mtimes can't be
+# used for this.
+#
+# Suites are built in STAGING, which must be outside the published tree but
+# on the same filesystem, and then renamed into place. This keeps
+# half-written shards out of the frontends' sync. A suite which is being
+# replaced is briefly missing between the two renames.
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+CHUNK_SIZE = 1024 * 1024
+INDEX_VERSION = 2
+PREFIX_RE = re.compile(r"[^a-z0-9]")
+
+
+def hash_shard(key):
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:2]
+
+
+def prefix_shard(key):
+    return PREFIX_RE.sub("_", key.lower()[:2]).ljust(2, "_")
+
+
+def prefix_keys(entry):
+    cid = entry["id"]
+    short = cid[: -len(".desktop")] if cid.endswith(".desktop") else cid
+    keys = {short.rsplit(".", 1)[-1].lower()}
+    if entry["package"]:
+        keys.add(entry["package"].lower())
+    return keys
+
+
+def components_files(suite_dir):
+    return sorted(suite_dir.glob("*/Components-*.yml.gz"))
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def sources_signature(suite_dir, files):
+    return {str(f.relative_to(suite_dir)): hash_file(f) for f in files}
+
+
+def localised(value):
+    if isinstance(value, dict):
+        return value.get("C")
+    return value
+
+
+def read_components(path):
+    """Yield one dict per component in a DEP-11 file, one document at a time."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for doc in yaml.load_all(f, Loader=SafeLoader):
+            if not isinstance(doc, dict) or "ID" not in doc:
+                # the header document
+                continue
+            package = doc.get("Package")
+            yield {
+                "id": str(doc["ID"]),
+                "package": str(package) if package is not None else None,
+                "type": doc.get("Type"),
+                "name": localised(doc.get("Name")),
+                "summary": localised(doc.get("Summary")),
+            }
+
+
+def collect_entries(suite_dir, files):
+    entries = {}
+    for path in files:
+        component = path.parent.name
+        arch = path.name[len("Components-") : -len(".yml.gz")]
+        for c in read_components(path):
+            key = (c["id"], c["package"], component)
+            entry = entries.get(key)
+            if entry is None:
+                entry = entries[key] = dict(
+                    c, component=component, architectures=[]
+                )
+            if arch not in entry["architectures"]:
+                entry["architectures"].append(arch)
+    for entry in entries.values():
+        entry["architectures"].sort()
+    return sorted(
+        entries.values(),
+        key=lambda e: (e["id"], e["package"] or "", e["component"]),
+    )
+
+
+def write_json(path, data):
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def write_shards(directory, shards):
+    directory.mkdir(parents=True)
+    for name, data in shards.items():
+        write_json(directory / f"{name}.json", data)
+
+
+def build_suite(suite_dir, out_dir, staging, sources):
+    entries = collect_entries(suite_dir, components_files(suite_dir))
+
+    by_id = defaultdict(lambda: defaultdict(list))
+    by_package = defaultdict(lambda: defaultdict(list))
+    by_prefix = defaultdict(set)
+    for entry in entries:
+        by_id[hash_shard(entry["id"])][entry["id"]].append(entry)
+        if entry["package"]:
+            shard = by_package[hash_shard(entry["package"])]
+            shard[entry["package"]].append(entry)
+        for key in prefix_keys(entry):
+            by_prefix[prefix_shard(key)].add((key, entry["id"]))
+
+    tmp_dir = staging / f"{out_dir.name}.new"
+    old_dir = staging / f"{out_dir.name}.old"
+    for d in (tmp_dir, old_dir):
+        shutil.rmtree(d, ignore_errors=True)
+
+    write_shards(tmp_dir / "id", by_id)
+    write_shards(tmp_dir / "package", by_package)
+    write_shards(
+        tmp_dir / "prefix",
+        {k: [list(p) for p in sorted(v)] for k, v in by_prefix.items()},
+    )
+    write_json(
+        tmp_dir / "meta.json",
+        {
+            "components": len(entries),
+            "sources": sources,
+            "updated": int(time.time()),
+            "version": INDEX_VERSION,
+        },
+    )
+
+    if out_dir.exists():
+        out_dir.rename(old_dir)
+    tmp_dir.rename(out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    return len(entries)
+
+
+def read_meta(out_dir):
+    try:
+        with (out_dir / "meta.json").open(encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a sharded JSON search index from DEP-11 data"
+    )
+    parser.add_argument("data", type=Path, help="The published data/ directory")
+    parser.add_argument("output", type=Path)
+    parser.add_argument(
+        "--staging",
+        type=Path,
+        required=True,
+        help="Where to build suites before moving them into place",
+    )
+    args = parser.parse_args()
+
+    args.output.mkdir(parents=True, exist_ok=True)
+    args.staging.mkdir(parents=True, exist_ok=True)
+    suites = {}
+
+    for suite_dir in sorted(p for p in args.data.iterdir() if p.is_dir()):
+        files = components_files(suite_dir)
+        if not files:
+            continue
+        out_dir = args.output / suite_dir.name
+        sources = sources_signature(suite_dir, files)
+        meta = read_meta(out_dir)
+        if (
+            meta
+            and meta.get("version") == INDEX_VERSION
+            and meta.get("sources") == sources
+        ):
+            print(f"{suite_dir.name}: unchanged")
+        else:
+            count = build_suite(suite_dir, out_dir, args.staging, sources)
+            print(f"{suite_dir.name}: indexed {count} components")
+            meta = read_meta(out_dir)
+        suites[suite_dir.name] = {
+            "components": meta["components"],
+            "updated": meta["updated"],
+        }
+
+    for out_dir in args.output.iterdir():
+        if out_dir.is_dir() and out_dir.name not in suites:
+            print(f"{out_dir.name}: removing stale index")
+            shutil.rmtree(out_dir)
+
+    index = args.output / "index.json"
+    tmp = args.staging / "index.json.new"
+    write_json(tmp, {"suites": suites, "version": INDEX_VERSION})
+    tmp.replace(index)
+
+
+if __name__ == "__main__":
+    main()
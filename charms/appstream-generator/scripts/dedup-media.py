@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# Copyright 2021 Canonical Ltd
+
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Deduplicate files across the given trees by hardlinking them into a
+# content-addressed store. Every regular file ends up as a link to
+# STORE/<hh>/<sha256>, so identical icons and screenshots exported for each
+# suite, pocket and component share a single inode. Files which are already
+# linked into the store are recognised by their inode and are not hashed
+# again. Blobs which nothing links to any more are pruned at the end.
+#
+# Only point this at trees whose files are only ever replaced by rename, such
+# as the public media which rsync writes, since a write through any link
+# changes every copy. Nothing here detects or repairs such a write.
+#
+# Relinked files take on the mtime of the copy which was stored first, so
+# their Last-Modified time changes, and rsync has to compare them with
+# --checksum rather than by size and mtime.
+#
+# The store must be on the same filesystem as the trees.
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def blob_path(store, digest):
+    return store / digest[:2] / digest
+
+
+def scan_store(store):
+    """Map (st_dev, st_ino) → blob path for everything already stored."""
+    inodes = {}
+    for blob in store.glob("??/*"):
+        st = blob.lstat()
+        inodes[(st.st_dev, st.st_ino)] = blob
+    return inodes
+
+
+def walk_files(tree):
+    stack = [tree]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def link_into_place(blob, path):
+    # Link to a temporary name first and rename over the original, so the
+    # path is never missing for anyone reading the tree at the same time.
+    tmp = f"{path}.dedup-tmp"
+    try:
+        os.unlink(tmp)
+    except FileNotFoundError:
+        pass
+    os.link(blob, tmp)
+    os.replace(tmp, path)
+
+
+def dedup_tree(tree, store, inodes, physical, stats):
+    # Inodes outside the store which we have already hashed, for trees which
+    # contained hardlinks of their own before we got to them.
+    digests = {}
+    for entry in walk_files(tree):
+        st = entry.stat(follow_symlinks=False)
+        key = (st.st_dev, st.st_ino)
+        stats["files"] += 1
+        stats["logical_bytes"] += st.st_size
+        if key in inodes:
+            physical[key] = st.st_size
+            continue
+
+        if key in digests:
+            digest = digests[key]
+        else:
+            digest = hash_file(entry.path)
+            digests[key] = digest
+            stats["hashed"] += 1
+        blob = blob_path(store, digest)
+        try:
+            bst = blob.lstat()
+        except FileNotFoundError:
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            os.link(entry.path, blob)
+            inodes[key] = blob
+            physical[key] = st.st_size
+            stats["stored"] += 1
+            continue
+
+        link_into_place(blob, entry.path)
+        inodes[(bst.st_dev, bst.st_ino)] = blob
+        physical[(bst.st_dev, bst.st_ino)] = bst.st_size
+        stats["linked"] += 1
+        if st.st_nlink == 1:
+            stats["reclaimed_bytes"] += st.st_size
+
+
+def prune_store(store, stats):
+    for blob in store.glob("??/*"):
+        if blob.lstat().st_nlink == 1:
+            blob.unlink()
+            stats["pruned"] += 1
+    for bucket in store.glob("??"):
+        try:
+            bucket.rmdir()
+        except OSError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Hardlink identical files into a content-addressed store"
+    )
+    parser.add_argument("--store", type=Path, required=True)
+    parser.add_argument(
+        "--report", type=Path, help="Write a JSON report to this file"
+    )
+    parser.add_argument("trees", type=Path, nargs="+")
+    args = parser.parse_args()
+
+    trees = [t for t in args.trees if t.is_dir()]
+    args.store.mkdir(parents=True, exist_ok=True)
+    store_dev = args.store.stat().st_dev
+    for tree in trees:
+        if tree.stat().st_dev != store_dev:
+            sys.exit(f"{args.store} is not on the same filesystem as {tree}")
+
+    stats = dict.fromkeys(
+        (
+            "files",
+            "hashed",
+            "stored",
+            "linked",
+            "pruned",
+            "logical_bytes",
+            "reclaimed_bytes",
+        ),
+        0,
+    )
+    inodes = scan_store(args.store)
+    # (st_dev, st_ino) → size of every inode the trees end up pointing at
+    physical = {}
+
+    for tree in trees:
+        dedup_tree(tree, args.store, inodes, physical, stats)
+    prune_store(args.store, stats)
+
+    stats["physical_bytes"] = sum(physical.values())
+    stats["saved_bytes"] = stats["logical_bytes"] - stats["physical_bytes"]
+    stats["trees"] = [str(t) for t in trees]
+    stats["timestamp"] = int(time.time())
+
+    mib = 1024 * 1024
+    print(
+        f"Deduplicated {stats['files']} files ({stats['hashed']} hashed, "
+        f"{stats['linked']} relinked, {stats['pruned']} blobs pruned): "
+        f"{stats['logical_bytes'] // mib} MiB stored in "
+        f"{stats['physical_bytes'] // mib} MiB, "
+        f"saving {stats['saved_bytes'] // mib} MiB "
+        f"({stats['reclaimed_bytes'] // mib} MiB reclaimed this run)"
+    )
+
+    if args.report:
+        tmp = args.report.with_name(f"{args.report.name}.tmp")
+        with tmp.open("w") as f:
+            json.dump(stats, f, indent=4, sort_keys=True)
+        tmp.replace(args.report)
+
+
+if __name__ == "__main__":
+    main()
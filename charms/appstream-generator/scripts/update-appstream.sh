@@ -5,11 +5,15 @@ set -eu
 BASE_DIR=/home/ubuntu/appstream
 
 ASGEN=/snap/bin/appstream-generator
+DEDUP_MEDIA=/home/ubuntu/dedup-media.py
+BUILD_SEARCH_INDEX=/home/ubuntu/build-search-index.py
 PUBLIC_DIR=${BASE_DIR}/appstream-public
 WORKSPACE_DIR=${BASE_DIR}/appstream-workdir
 STAMP_FILE=${BASE_DIR}/last-update
 LOG_BASE_DIR=${BASE_DIR}/logs
 CLEAN_FILE=${BASE_DIR}/clean
+MEDIA_STORE=${BASE_DIR}/media-store
+SEARCH_STAGING=${BASE_DIR}/search-staging
 FORGET_FILE=${BASE_DIR}/forget
 
 RELEASES=$(jq -r '.Suites | keys | reduce .[] as $item ("";. + " " + $item) | ltrimstr(" ")' "${WORKSPACE_DIR}/asgen-config.json")
@@ -47,9 +51,33 @@ done
 
 echo "Updating ${PUBLIC_DIR}"
 
-rsync -a --verbose --delete-after "${WORKSPACE_DIR}/export/" --filter "protect media/main" --filter "protect media/universe" --filter "protect media/multiverse" --filter "protect media/restricted" --filter "protect data/xenial" --filter "protect html/xenial" "${PUBLIC_DIR}/"
+rsync -a --verbose --delete-after "${WORKSPACE_DIR}/export/" --exclude "/media" --filter "protect data/xenial" --filter "protect html/xenial" --filter "protect /search" "${PUBLIC_DIR}/"
+
+# The public media is deduplicated below, which gives each relinked file the
+# mtime of the copy that was stored first, so compare media by content rather
+# than by size and mtime. rsync only ever replaces files here by rename, so
+# writes never go through to the other links of a blob.
+rsync -a --checksum --verbose --delete-after "${WORKSPACE_DIR}/export/media/" --filter "protect /main" --filter "protect /universe" --filter "protect /multiverse" --filter "protect /restricted" "${PUBLIC_DIR}/media/"
 touch ${STAMP_FILE}
 
+echo "Updating search index"
+${BUILD_SEARCH_INDEX} --staging "${SEARCH_STAGING}" "${PUBLIC_DIR}/data" "${PUBLIC_DIR}/search" || echo "Updating search index failed"
+
+echo "Deduplicating ${PUBLIC_DIR}/media"
+
+# Only the public media directories which this run exported; the protected,
+# older media trees are left alone. asgen's workspace is never deduplicated,
+# so it does not share any storage with what is published.
+public_media=""
+for dir in "${WORKSPACE_DIR}"/export/media/*/; do
+    [ -d "${dir}" ] || continue
+    public_media="${public_media} ${PUBLIC_DIR}/media/$(basename "${dir}")"
+done
+if [ -n "${public_media}" ]; then
+    # shellcheck disable=SC2086
+    ${DEDUP_MEDIA} --store "${MEDIA_STORE}" --report "${LOG_BASE_DIR}/media-dedup.json" ${public_media} || echo "Deduplicating media failed"
+fi
+
 echo "Running cleanup"
 ${ASGEN} -w ${WORKSPACE_DIR} cleanup
 
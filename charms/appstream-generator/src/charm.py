@@ -39,7 +39,7 @@ APPSTREAM_WORKDIR = APPSTREAM_BASE / "appstream-workdir"
 ENVIRONMENT_FILE = Path("/etc/environment.d/proxy.conf")
 INPUT_FILENAME = "asgen-config.json.in"
 OUTPUT_FILENAME = APPSTREAM_WORKDIR / "asgen-config.json"
-PACKAGES_TO_INSTALL = ["jq"]
+PACKAGES_TO_INSTALL = ["jq", "python3-yaml"]
 SNAPS_TO_INSTALL = {"appstream-generator": DEFAULT_SNAP_CHANNEL}
 SYSTEMD_ENABLE_UNITS = ("appstream-generator.timer",)
 SYSTEMD_UNITS = ("appstream-generator.service", "appstream-generator.timer")